@@ -1,7 +1,22 @@
 import os
+
+# Keep Tesseract single-threaded; pages and passes already run in parallel,
+# and OpenMP threads on top of that only oversubscribe the CPU. Must be set
+# before tesserocr loads libtesseract (and is inherited by tesseract
+# subprocesses).
+os.environ.setdefault("OMP_THREAD_LIMIT", "1")
+os.environ.setdefault("OMP_NUM_THREADS", "1")
+
 import re
 import io
+import asyncio
+import hashlib
+import threading
+import atexit
 import traceback
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from itertools import islice
 
 from flask import (
     Flask,
@@ -11,8 +26,17 @@ from flask import (
     send_file,
     session
 )
-from pdf2image import convert_from_bytes
-import pytesseract
+from pdf2image import convert_from_path, pdfinfo_from_path
+import aiopytesseract
+import diskcache
+from PIL import Image
+
+# Optional in-process Tesseract binding (see _tesserocr_page). Without it we
+# fall back to one tesseract subprocess per OCR pass via aiopytesseract.
+try:
+    import tesserocr
+except ImportError:
+    tesserocr = None
 
 # For PDF generation
 from reportlab.lib.pagesizes import A4
@@ -23,10 +47,14 @@ from reportlab.platypus import Table, TableStyle
 from reportlab.lib.utils import ImageReader
 from PyPDF2 import PdfMerger, PdfReader
 import tempfile
+from waitress import serve
 
 app = Flask(__name__)
 app.secret_key = 'your-secret-key-change-this-in-production'
 
+# Reject uploads larger than this (MB) before they are buffered
+app.config["MAX_CONTENT_LENGTH"] = int(os.environ.get("MAX_UPLOAD_MB", 50)) * 1024 * 1024
+
 # ---------------------------------------------------------
 #  CONFIG – change these paths if your installation differs
 # ---------------------------------------------------------
@@ -34,76 +62,409 @@ app.secret_key = 'your-secret-key-change-this-in-production'
 # Path to tesseract.exe (if not already in PATH)
 TESSERACT_EXE = r"C:\Program Files\Tesseract-OCR\tesseract.exe"
 
-# Poppler bin path (where pdfinfo / pdftoppm / pdfimages live)
-POPPLER_PATH = r"C:\poppler-24.08.0\Library\bin"
+# Poppler bin path (where pdfinfo / pdftoppm / pdfimages live);
+# None means they are found on PATH (the usual case on Linux)
+POPPLER_PATH = os.environ.get("POPPLER_PATH", r"C:\poppler-24.08.0\Library\bin")
+if not os.path.isdir(POPPLER_PATH):
+    POPPLER_PATH = None
+
+# tessdata folder (*.traineddata), used by the in-process tesserocr backend;
+# None lets tesserocr use the location it was built with
+TESSDATA_PATH = os.environ.get("TESSDATA_PATH")
 
 if os.path.exists(TESSERACT_EXE):
-    pytesseract.pytesseract.tesseract_cmd = TESSERACT_EXE
+    aiopytesseract.base_command.TESSERACT_CMD = TESSERACT_EXE
+    if TESSDATA_PATH is None:
+        TESSDATA_PATH = os.path.join(os.path.dirname(TESSERACT_EXE), "tessdata", "")
+
+# Max number of pages being OCR'd at the same time within one request, and
+# max number of Tesseract processes/threads running across the whole server
+OCR_CONCURRENCY = int(os.environ.get("OCR_CONCURRENCY", os.cpu_count() or 1))
+
+# Seconds before a single Tesseract call (or in-process OCR pass) is aborted
+OCR_TIMEOUT = float(os.environ.get("OCR_TIMEOUT", 120))
+
+# Rasterization resolution; raise back towards 300 if OCR accuracy drops
+OCR_DPI = int(os.environ.get("OCR_DPI", 200))
+
+# Multiple OCR configurations per page for better table reading:
+#   STANDARD = automatic page segmentation
+#   TABLE    = uniform block of text (table-optimized)
+#   DATA     = single column of variable-size text (data extraction)
+OCR_PASSES = (
+    ("STANDARD", 3),
+    ("TABLE", 6),
+    ("DATA", 4),
+)
+
+# Engine settings shared by every pass:
+#   OEM 1 = LSTM engine only (the legacy engine is never initialized)
+#   no dictionaries = less load-time I/O and no dictionary correction passes
+#   no inversion check = datasheets are dark text on a light background
+OCR_OEM = 1
+OCR_VARIABLES = {
+    "tessedit_do_invert": "0",
+    "load_system_dawg": "0",
+    "load_freq_dawg": "0",
+}
+
+# OCR results cache (see ocr_pdf_to_text_cached)
+OCR_CACHE_SIZE = int(os.environ.get("OCR_CACHE_SIZE", 128))
+OCR_CACHE_DIR = os.environ.get(
+    "OCR_CACHE_DIR",
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), ".ocr_cache"),
+)
+
+_ocr_memory_cache = OrderedDict()
+_ocr_memory_lock = threading.Lock()
+_ocr_disk_cache = diskcache.Cache(OCR_CACHE_DIR)
+
+# tesserocr handles: one per OCR thread, created on first use and reused
+# for every page afterwards so the traineddata is only loaded once
+_tess_local = threading.local()
+_tess_apis = []
+_tess_apis_lock = threading.Lock()
+_tess_executor = (
+    ThreadPoolExecutor(max_workers=OCR_CONCURRENCY, thread_name_prefix="tesserocr")
+    if tesserocr is not None else None
+)
+
+# Process-wide slots for tesseract subprocesses; every request runs its own
+# event loop, so this has to be a thread-level semaphore
+_tess_process_slots = threading.BoundedSemaphore(OCR_CONCURRENCY)
 
 
 # ==================== OCR HELPERS ====================
 
-def ocr_pdf_to_text(pdf_bytes: bytes) -> str:
+def _render_page(pdf_path: str, page_num: int, output_folder: str) -> bytes:
+    """
+    Rasterize a single PDF page and return the image file bytes for Tesseract.
+    Poppler writes an uncompressed 8-bit grayscale PGM straight to disk, so
+    there is no PIL decode or PNG re-encode on our side.
+    """
+    image_paths = convert_from_path(
+        pdf_path,
+        dpi=OCR_DPI,
+        poppler_path=POPPLER_PATH,
+        grayscale=True,
+        first_page=page_num,
+        last_page=page_num,
+        output_folder=output_folder,
+        paths_only=True,
+    )
+    if not image_paths:
+        raise RuntimeError(f"Could not render page {page_num} of the PDF")
+    image_path = image_paths[0]
+    try:
+        with open(image_path, "rb") as fh:
+            return fh.read()
+    finally:
+        os.remove(image_path)
+
+
+def _get_tess_api():
+    """Return this thread's tesserocr handle, initializing it on first use."""
+    api = getattr(_tess_local, "api", None)
+    if api is None:
+        if TESSDATA_PATH:
+            api = tesserocr.PyTessBaseAPI(
+                path=TESSDATA_PATH, lang="eng",
+                oem=OCR_OEM, variables=OCR_VARIABLES,
+            )
+        else:
+            api = tesserocr.PyTessBaseAPI(
+                lang="eng", oem=OCR_OEM, variables=OCR_VARIABLES,
+            )
+        _tess_local.api = api
+        with _tess_apis_lock:
+            _tess_apis.append(api)
+    return api
+
+
+@atexit.register
+def _end_tess_apis():
+    """Release every tesserocr handle at interpreter shutdown."""
+    with _tess_apis_lock:
+        for api in _tess_apis:
+            api.End()
+        _tess_apis.clear()
+
+
+def _tesserocr_page(image: bytes):
     """
-    Convert a PDF (bytes) to text via pdf2image + Tesseract OCR.
+    Run all OCR passes on one page image inside this process with the
+    thread's persistent tesserocr handle. Returns one text per OCR_PASSES entry.
+    """
+    api = _get_tess_api()
+    page = Image.open(io.BytesIO(image))
+    texts = []
+
+    for _label, psm in OCR_PASSES:
+        api.SetPageSegMode(psm)
+        api.SetImage(page)
+        api.SetSourceResolution(OCR_DPI)
+        # Tesseract checks the deadline (ms) while recognizing and aborts
+        # the pass, so a stuck page doesn't hold an executor thread forever
+        if not api.Recognize(timeout=int(OCR_TIMEOUT * 1000)):
+            raise aiopytesseract.exceptions.TesseractTimeoutError(OCR_TIMEOUT)
+        texts.append(api.GetUTF8Text())
+
+    return texts
+
+
+async def _ocr_pdf_pages(pdf_path: str, output_folder: str):
+    """
+    Render and OCR every page of the PDF concurrently, one task per page.
+    Pages are rendered only when a slot frees up, so at most
+    OCR_CONCURRENCY page images are held in memory at once, and rendering
+    of later pages overlaps with OCR of earlier ones.
+    Returns one text chunk per page, in page order.
+    """
+    info = await asyncio.to_thread(
+        pdfinfo_from_path, pdf_path, poppler_path=POPPLER_PATH
+    )
+    page_sem = asyncio.Semaphore(OCR_CONCURRENCY)
+
+    async def run_pass(image: bytes, psm: int) -> str:
+        # Poll instead of blocking a worker thread on acquire(), so a
+        # cancelled task never ends up holding a slot
+        while not _tess_process_slots.acquire(blocking=False):
+            await asyncio.sleep(0.05)
+        try:
+            return await aiopytesseract.image_to_string(
+                image, dpi=OCR_DPI, lang="eng", psm=psm, oem=OCR_OEM,
+                timeout=OCR_TIMEOUT, config=list(OCR_VARIABLES.items()),
+            )
+        finally:
+            _tess_process_slots.release()
+
+    async def ocr_page(page_num: int) -> str:
+        async with page_sem:
+            image = await asyncio.to_thread(
+                _render_page, pdf_path, page_num, output_folder
+            )
+            if tesserocr is not None:
+                texts = await asyncio.get_running_loop().run_in_executor(
+                    _tess_executor, _tesserocr_page, image
+                )
+            else:
+                texts = await asyncio.gather(*[
+                    run_pass(image, psm) for _label, psm in OCR_PASSES
+                ])
+        return "\n".join(
+            f"=== PAGE {page_num} {label} ===\n{text}"
+            for (label, _psm), text in zip(OCR_PASSES, texts)
+        )
+
+    return await asyncio.gather(*[
+        ocr_page(page_num) for page_num in range(1, info["Pages"] + 1)
+    ])
+
+
+def ocr_pdf_to_text(pdf_path: str) -> str:
+    """
+    Convert a PDF file to text via pdf2image + Tesseract OCR.
     Uses enhanced settings for better table recognition.
+    All pages and passes are OCR'd concurrently (see OCR_CONCURRENCY).
+    Poppler reads the PDF straight from disk for each page.
     """
-    pages = convert_from_bytes(pdf_bytes, dpi=300, poppler_path=POPPLER_PATH)
-    text_chunks = []
-    
-    for page_num, page in enumerate(pages, 1):
-        # Try multiple OCR configurations for better table reading
-        
-        # Config 1: Standard OCR
-        text1 = pytesseract.image_to_string(page, lang="eng")
-        text_chunks.append(f"=== PAGE {page_num} STANDARD ===\n{text1}")
-        
-        # Config 2: Table-optimized OCR
-        table_config = r'--oem 3 --psm 6'
-        text2 = pytesseract.image_to_string(page, lang="eng", config=table_config)
-        text_chunks.append(f"=== PAGE {page_num} TABLE ===\n{text2}")
-        
-        # Config 3: Data extraction optimized
-        data_config = r'--oem 3 --psm 4'
-        text3 = pytesseract.image_to_string(page, lang="eng", config=data_config)
-        text_chunks.append(f"=== PAGE {page_num} DATA ===\n{text3}")
-    
+    with tempfile.TemporaryDirectory() as tmpdir:
+        text_chunks = asyncio.run(_ocr_pdf_pages(pdf_path, tmpdir))
+
     return "\n".join(text_chunks)
 
 
+def _file_digest(path: str) -> str:
+    """BLAKE2b hex digest of a file, read in 1 MB chunks."""
+    h = hashlib.blake2b(digest_size=16)
+    with open(path, "rb") as fh:
+        for chunk in iter(lambda: fh.read(1 << 20), b""):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+def _ocr_settings_digest() -> str:
+    """Hash of every setting (and the backend) that affects the OCR text."""
+    settings = (
+        OCR_DPI, OCR_OEM, OCR_PASSES, sorted(OCR_VARIABLES.items()),
+        "tesserocr" if tesserocr is not None else "tesseract",
+    )
+    return hashlib.blake2b(repr(settings).encode(), digest_size=8).hexdigest()
+
+
+def ocr_pdf_to_text_cached(pdf_path: str) -> str:
+    """
+    Same as ocr_pdf_to_text(), but re-uploads of an identical PDF are served
+    from cache: first an in-memory LRU, then the on-disk cache (which
+    survives restarts). Keyed by a hash of the PDF content + OCR settings.
+    """
+    digest = _file_digest(pdf_path)
+    key = f"{digest}-{_ocr_settings_digest()}"
+
+    with _ocr_memory_lock:
+        text = _ocr_memory_cache.get(key)
+        if text is not None:
+            _ocr_memory_cache.move_to_end(key)
+            return text
+
+    text = _ocr_disk_cache.get(key)
+    if text is None:
+        text = ocr_pdf_to_text(pdf_path)
+        _ocr_disk_cache.set(key, text)
+
+    with _ocr_memory_lock:
+        _ocr_memory_cache[key] = text
+        _ocr_memory_cache.move_to_end(key)
+        while len(_ocr_memory_cache) > OCR_CACHE_SIZE:
+            _ocr_memory_cache.popitem(last=False)
+
+    return text
+
+
 # ==================== TEXT PARSING HELPERS ====================
 
+# Patterns are compiled once at import instead of on every request
+
+# One line of text (same line breaks as str.splitlines, incl. Tesseract's \f)
+_LINE_RE = re.compile(r'[^\n\r\v\f\x1c\x1d\x1e\x85\u2028\u2029]+')
+
+# Header tokens, scanned in a single pass by scan_header():
+#   kv    = a voltage such as '400kV' / '400 kV'
+#   word  = a run of letters ('copper', 'conductor', ...)
+#   comma = clause separator
+_HEADER_TOKEN_RE = re.compile(r'(?P<kv>\d+(?:\.\d+)?)\s*k\s*v|(?P<word>[a-z]+)|(?P<comma>,)')
+
+# Metal names that can appear before 'conductor' / 'sheath' in the header
+_HEADER_METALS = {
+    "copper": "copper",
+    "cu": "copper",
+    "aluminium": "aluminium",
+    "aluminum": "aluminium",
+    "al": "aluminium",
+    "lead": "lead",
+    "steel": "steel",
+    "bronze": "bronze",
+}
+
+# Priority when several sheath metals are named in the header
+_SHEATH_METAL_ORDER = ("aluminium", "copper", "lead", "steel", "bronze")
+
+# Insulation keywords (whole words) in priority order
+_WORD_RE = re.compile(r'[a-z]+')
+_INSULATION_WORDS = (
+    ({"xlpe"}, "XLPE"),
+    ({"epr"}, "EPR"),
+    ({"pvc"}, "PVC"),
+    ({"pe", "hdpe", "mdpe", "ldpe"}, "PE"),
+)
+
+# 'oil-filled' / 'oil filled' (a bare 'oil', e.g. 'oil resistant', is not insulation)
+_OIL_FILLED_RE = re.compile(r'\boil[\s-]+filled\b')
+
+# '<mat> outer sheath'
+_OUTER_SHEATH_RE = re.compile(r'(\b[a-z]+)\s+outer\s+sheath')
+
+# 'RATED VOLTAGE : 76/132/145 kV'
+_RATED_V_RE = re.compile(r"RATED\s+VOLTAGE\s*:\s*([0-9/\s\.]+)kV", re.IGNORECASE)
+
+# Plain numbers: '132', '1.5' / with comma decimals: '40,5'
+_NUM_RE = re.compile(r"\d+(?:\.\d+)?")
+_DEC_NUM_RE = re.compile(r'(\d+(?:[.,]\d+)?)')
+
+# Short-circuit currents: '40 kA', '31.5kA', '40,5 k A'
+_KA_NUM_RE = re.compile(r'(\d+(?:[.,]\d+)?)\s*k\s*a\b', re.IGNORECASE)
+
+# Words marking a value as the short-circuit rating, and how far back
+# (in characters, never past the start of the line) from a kA value we
+# look for them
+_SCC_KEYWORDS = ("short", "circuit", "fault", "ik", "isc")
+_SCC_CONTEXT_CHARS = 80
+
+# Plausible short-circuit currents (kA), exclusive bounds
+_SCC_RANGE_KA = (0, 1000)
+
+# Durations: '1 s', '3 sec', '3 seconds'
+_SEC_RE = re.compile(r'(\d+(?:[.,]\d+)?)\s*(s|sec|secs|second|seconds)\b', re.IGNORECASE)
+
+# Conductor size patterns
+_COND_SIZE_RE = re.compile(r'CONDUCTOR\s+SIZE\s*[:：]\s*(\d+(?:\.\d+)?)\s*(?:SQ|sq)?\.?mm', re.IGNORECASE)
+_COND_1C_RE = re.compile(r'1C?\s*[xX×]\s*(\d+(?:\.\d+)?)\s*mm', re.IGNORECASE)
+_CROSS_AREA_RE = re.compile(r'cross\s+section(?:al)?\s+area\s*[:：]\s*(\d+(?:\.\d+)?)\s*mm', re.IGNORECASE)
+
+# Loose numbers in sheath table rows: '15', '1.7', '97.'
+_ROW_NUM_RE = re.compile(r'\d+\.?\d*')
+
+
 def get_first_nonempty_lines(text: str, n: int = 5):
-    """Return first n non-empty lines from OCR text."""
-    lines = [ln.strip() for ln in text.splitlines() if ln.strip()]
-    return lines[:n]
+    """
+    Return first n non-empty lines from OCR text.
+    Stops as soon as n lines are found instead of splitting the whole text.
+    """
+    stripped = (m.group().strip() for m in _LINE_RE.finditer(text))
+    return list(islice((ln for ln in stripped if ln), n))
 
 
-def extract_header_voltage_and_material(lines):
+def scan_header(lines):
+    """
+    Walk the first 4 header lines ONCE and collect everything the header
+    helpers need:
+      - first voltage in lines 1–2            -> 'voltage_kv'
+      - metals mentioned in lines 1–2         -> 'metals_top'
+      - metals followed by 'conductor' in the same clause -> 'conductor_metals'
+      - metals followed by 'sheath' in the same clause    -> 'sheath_metals'
+    A clause ends at a comma, e.g.
+      '6 segment copper conductor, smooth aluminium sheath ...'
+    """
+    header = " ".join(lines[:4]).lower() if lines else ""
+    top_end = len(" ".join(lines[:2]))
+
+    scan = {
+        "voltage_kv": None,
+        "metals_top": set(),
+        "conductor_metals": set(),
+        "sheath_metals": set(),
+    }
+    clause_metals = set()
+
+    for m in _HEADER_TOKEN_RE.finditer(header):
+        in_top = m.end() <= top_end
+
+        if m.group("comma"):
+            clause_metals = set()
+        elif m.group("kv"):
+            if in_top and scan["voltage_kv"] is None:
+                scan["voltage_kv"] = float(m.group("kv"))
+        else:
+            word = m.group("word")
+            metal = _HEADER_METALS.get(word)
+            if metal:
+                clause_metals.add(metal)
+                if in_top:
+                    scan["metals_top"].add(metal)
+            elif word.startswith("conductor"):
+                scan["conductor_metals"] |= clause_metals
+            elif word.startswith("sheath"):
+                scan["sheath_metals"] |= clause_metals
+
+    return scan
+
+
+def extract_header_voltage_and_material(scan):
     """
     Look at the first 1–2 non-empty lines for something like:
       'CROSS SECTION OF 400kV AL 1Cx2500SQmm XLPE INSULATED CABLE'
     We treat this voltage as the MAIN rated voltage (132, 220, 400, etc.).
+    Takes the result of scan_header().
     """
-    header = " ".join(lines[:2]).lower() if lines else ""
-    voltage_kv = None
     material = None
 
-    # Voltage: e.g. '400kV', '400 kV'
-    m = re.search(r'(\d+(?:\.\d+)?)\s*k\s*?v', header, flags=re.IGNORECASE)
-    if m:
-        try:
-            voltage_kv = float(m.group(1))
-        except ValueError:
-            voltage_kv = None
-
     # Conductor material (from header only, rough)
-    if "copper" in header or " cu " in header:
+    if "copper" in scan["metals_top"]:
         material = "Copper"
-    elif ("aluminium" in header or "aluminum" in header or " al " in header):
+    elif "aluminium" in scan["metals_top"]:
         material = "Aluminium"
 
-    return voltage_kv, material
+    return scan["voltage_kv"], material
 
 
 def extract_header_insulation_and_outer(lines):
@@ -118,22 +479,18 @@ def extract_header_insulation_and_outer(lines):
     insulation = None
     outer_sheath = None
 
-    # --- Insulation material ---
-    if "xlpe" in header:
-        insulation = "XLPE"
-    elif "epr" in header:
-        insulation = "EPR"
-    elif "pvc" in header:
-        insulation = "PVC"
-    elif ("pe insulation" in header or
-          "pe insulated" in header or
-          " pe " in header):
-        insulation = "PE"
-    elif "oil-filled" in header or "oil filled" in header:
-        insulation = "oil"
+    # --- Insulation material: first match in priority order ---
+    words = set(_WORD_RE.findall(header))
+    for names, name in _INSULATION_WORDS:
+        if not words.isdisjoint(names):
+            insulation = name
+            break
+    else:
+        if _OIL_FILLED_RE.search(header):
+            insulation = "oil"
 
     # --- Outer sheath: look for "<mat> outer sheath" ---
-    m = re.search(r'(\b[a-z]+)\s+outer\s+sheath', header)
+    m = _OUTER_SHEATH_RE.search(header)
     if m:
         mat = m.group(1).upper()
         # Accept some typical outer sheath materials
@@ -143,46 +500,40 @@ def extract_header_insulation_and_outer(lines):
     return insulation, outer_sheath
 
 
-def extract_conductor_and_sheath_material_from_header(lines):
+def extract_conductor_and_sheath_material_from_header(scan):
     """
     From the first few lines, try to identify:
       - conductor material  (Copper / Aluminium)
       - metallic sheath material (Aluminium / Copper / Lead / Steel / Bronze)
     Handles phrases like:
       '6 segment copper conductor, smooth aluminium sheath ...'
+    Takes the result of scan_header().
     """
-    header = " ".join(lines[:4]).lower() if lines else ""
-
     conductor = None
     sheath = None
 
-    # --- conductor material patterns ---
-    if re.search(r'\b(copper|cu)\b[^,\n]*conductor', header):
+    # --- conductor material ---
+    if "copper" in scan["conductor_metals"]:
         conductor = "Copper"
-    elif re.search(r'\b(aluminium|aluminum|al)\b[^,\n]*conductor', header):
+    elif "aluminium" in scan["conductor_metals"]:
         conductor = "Aluminium"
 
-    # --- sheath material patterns ---
-    if re.search(r'\b(aluminium|aluminum|al)\b[^,\n]*sheath', header):
-        sheath = "aluminium"
-    elif re.search(r'\b(copper|cu)\b[^,\n]*sheath', header):
-        sheath = "copper"
-    elif re.search(r'\blead\b[^,\n]*sheath', header):
-        sheath = "lead"
-    elif re.search(r'\bsteel\b[^,\n]*sheath', header):
-        sheath = "steel"
-    elif re.search(r'\bbronze\b[^,\n]*sheath', header):
-        sheath = "bronze"
+    # --- sheath material ---
+    for name in _SHEATH_METAL_ORDER:
+        if name in scan["sheath_metals"]:
+            sheath = name
+            break
 
     return conductor, sheath
 
 
-def detect_conductor_material_global(text: str):
+def detect_conductor_material_global(text: str, text_lower: str = None):
     """
     Aggressive scan of the WHOLE OCR text to find conductor material.
     Used as backup when header isn't clear.
+    Pass text_lower if the caller already has text.lower().
     """
-    lower = text.lower()
+    lower = text_lower if text_lower is not None else text.lower()
 
     # Strong patterns
     if "copper conductor" in lower or "cu conductor" in lower:
@@ -211,17 +562,13 @@ def extract_rated_voltages(text: str):
     Find 'RATED VOLTAGE : 76/132/145 kV' or 'RATED VOLTAGE: 220/400/420 kV'
     and return list [76, 132, 145] or [220, 400, 420].
     """
-    m = re.search(
-        r"RATED\s+VOLTAGE\s*:\s*([0-9/\s\.]+)kV",
-        text,
-        flags=re.IGNORECASE,
-    )
+    m = _RATED_V_RE.search(text)
     if not m:
         return []
 
     nums_str = m.group(1)
     nums = []
-    for num in re.findall(r"\d+(?:\.\d+)?", nums_str):
+    for num in _NUM_RE.findall(nums_str):
         try:
             nums.append(float(num))
         except ValueError:
@@ -229,67 +576,67 @@ def extract_rated_voltages(text: str):
     return nums
 
 
-def extract_short_circuit_current(text: str):
+def _max_in_range(values, lo: float, hi: float):
+    """Largest value strictly between lo and hi, or None if there is none."""
+    return max((v for v in values if lo < v < hi), default=None)
+
+
+def _keyword_line_numbers(lower: str):
+    """
+    All numbers on lines that mention a short-circuit keyword and kA,
+    wherever the unit sits on the line (e.g. 'short circuit (ka, 1 s)  40').
+    """
+    for line in lower.splitlines():
+        if "ka" in line and any(k in line for k in _SCC_KEYWORDS):
+            for m in _DEC_NUM_RE.finditer(line):
+                yield float(m.group(1).replace(",", "."))
+
+
+def extract_short_circuit_current(text: str, text_lower: str = None):
     """
     Aggressively try to find the short-circuit current in kA.
-    We focus on lines mentioning 'short / circuit / fault / Ik / Isc'
-    plus 'kA'.
+    Every 'xx kA' value is collected in one scan of the text; values with
+    'short / circuit / fault / Ik / Isc' shortly before them on the same line
+    are preferred.
+    Tables that put the unit first ('Short-circuit current (kA): 31.5')
+    are covered by a fallback over keyword lines that mention kA.
+    Pass text_lower if the caller already has text.lower().
     """
-    lines = text.splitlines()
+    lower = text_lower if text_lower is not None else text.lower()
+    preferred = []
     candidates = []
 
-    keywords = ("short", "circuit", "fault", "ik", "isc")
+    for m in _KA_NUM_RE.finditer(lower):
+        val = float(m.group(1).replace(",", "."))
+        candidates.append(val)
 
-    # Pass 1: lines clearly related to short-circuit current
-    for line in lines:
-        lower = line.lower()
-        if any(k in lower for k in keywords) and ("k" in lower and "a" in lower):
-            for m in re.finditer(r'(\d+(?:[.,]\d+)?)', line):
-                try:
-                    val = float(m.group(1).replace(",", "."))
-                except ValueError:
-                    continue
-                if 0 < val < 1000:
-                    candidates.append(val)
-
-    # Pass 2: any line containing something like 'xx kA'
-    if not candidates:
-        for line in lines:
-            lower = line.lower()
-            if "k" not in lower or "a" not in lower:
-                continue
-            for m in re.finditer(r'(\d+(?:[.,]\d+)?)', line):
-                try:
-                    val = float(m.group(1).replace(",", "."))
-                except ValueError:
-                    continue
-                if 0 < val < 1000:
-                    candidates.append(val)
-
-    if not candidates:
-        return None
+        line_start = lower.rfind("\n", 0, m.start()) + 1
+        context = lower[max(line_start, m.start() - _SCC_CONTEXT_CHARS):m.start()]
+        if any(k in context for k in _SCC_KEYWORDS):
+            preferred.append(val)
 
     # Use the maximum candidate as the worst-case short-circuit current
-    return max(candidates)
+    lo, hi = _SCC_RANGE_KA
+    scc = _max_in_range(preferred, lo, hi)
+    if scc is None:
+        scc = _max_in_range(_keyword_line_numbers(lower), lo, hi)
+    if scc is None:
+        scc = _max_in_range(candidates, lo, hi)
+    return scc
 
 
-def extract_time_seconds(text: str):
+def extract_time_seconds(text: str, text_lower: str = None):
     """
     Try to find short-circuit duration (e.g. '1 s', '3 sec', '3 seconds').
     Prefer lines that mention 'short / circuit / fault / Ik / Isc'.
+    Pass text_lower if the caller already has text.lower().
     """
-    lines = text.splitlines()
-    keywords = ("short", "circuit", "fault", "ik", "isc")
+    lower = text_lower if text_lower is not None else text.lower()
 
     # Pass 1: relevant lines
-    for line in lines:
-        lower = line.lower()
-        if any(k in lower for k in keywords):
-            m = re.search(
-                r'(\d+(?:[.,]\d+)?)\s*(s|sec|secs|second|seconds)\b',
-                lower,
-                re.IGNORECASE,
-            )
+    for line in lower.splitlines():
+        if any(k in line for k in _SCC_KEYWORDS):
+            m = _SEC_RE.search(line)
             if m:
                 try:
                     return float(m.group(1).replace(",", "."))
@@ -297,11 +644,7 @@ def extract_time_seconds(text: str):
                     pass
 
     # Pass 2: anywhere in text
-    m = re.search(
-        r'(\d+(?:[.,]\d+)?)\s*(s|sec|secs|second|seconds)\b',
-        text,
-        re.IGNORECASE,
-    )
+    m = _SEC_RE.search(lower)
     if m:
         try:
             return float(m.group(1).replace(",", "."))
@@ -365,17 +708,17 @@ def extract_conductor_size(text: str):
     Returns the numeric value (e.g., 3000) or None
     """
     # Pattern 1: CONDUCTOR SIZE : 3000 SQmm
-    match = re.search(r'CONDUCTOR\s+SIZE\s*[:：]\s*(\d+(?:\.\d+)?)\s*(?:SQ|sq)?\.?mm', text, re.IGNORECASE)
+    match = _COND_SIZE_RE.search(text)
     if match:
         return float(match.group(1))
     
     # Pattern 2: 1C x 3000mm²
-    match = re.search(r'1C?\s*[xX×]\s*(\d+(?:\.\d+)?)\s*mm', text, re.IGNORECASE)
+    match = _COND_1C_RE.search(text)
     if match:
         return float(match.group(1))
     
     # Pattern 3: Cross sectional area: 3000 mm²
-    match = re.search(r'cross\s+section(?:al)?\s+area\s*[:：]\s*(\d+(?:\.\d+)?)\s*mm', text, re.IGNORECASE)
+    match = _CROSS_AREA_RE.search(text)
     if match:
         return float(match.group(1))
     
@@ -399,7 +742,7 @@ def extract_sheath_dimensions(text: str):
             print(f"Found METALLIC SHEATH at line {i}: '{line}'")
             
             # Extract all numbers from this line
-            numbers = re.findall(r'\d+\.?\d*', line)
+            numbers = _ROW_NUM_RE.findall(line)
             print(f"Numbers in this line: {numbers}")
             
             if len(numbers) >= 2:
@@ -487,7 +830,7 @@ def extract_sheath_dimensions(text: str):
         if '6)' in line or '6 )' in line:
             print(f"Found row 6 at line {i}: '{line}'")
             
-            numbers = re.findall(r'\d+\.?\d*', line)
+            numbers = _ROW_NUM_RE.findall(line)
             print(f"Numbers in row 6: {numbers}")
             
             if len(numbers) >= 3:  # Should have 6, thickness, outer_diameter
@@ -547,9 +890,13 @@ def extract_cable_parameters(text: str):
     # Use a few top non-empty lines as "header"
     lines = get_first_nonempty_lines(text, n=8)
 
-    header_voltage, header_material = extract_header_voltage_and_material(lines)
+    # Lowercase the (possibly large) OCR text once for all full-text scans
+    text_lower = text.lower()
+
+    header_scan = scan_header(lines)
+    header_voltage, header_material = extract_header_voltage_and_material(header_scan)
     insulation, outer_sheath = extract_header_insulation_and_outer(lines)
-    header_conductor, sheath_material = extract_conductor_and_sheath_material_from_header(lines)
+    header_conductor, sheath_material = extract_conductor_and_sheath_material_from_header(header_scan)
 
     # Conductor material:
     # 1) exact header patterns (e.g. "copper conductor")
@@ -557,13 +904,13 @@ def extract_cable_parameters(text: str):
     # 3) fallback to generic header material
     conductor_material = (
         header_conductor
-        or detect_conductor_material_global(text)
+        or detect_conductor_material_global(text, text_lower)
         or header_material
     )
 
     rated_voltages = extract_rated_voltages(text)
-    scc_ka = extract_short_circuit_current(text)
-    time_sec = extract_time_seconds(text)
+    scc_ka = extract_short_circuit_current(text, text_lower)
+    time_sec = extract_time_seconds(text, text_lower)
     conductor_size = extract_conductor_size(text)
     print("=== CALLING SHEATH EXTRACTION ===")
     sheath_dims = extract_sheath_dimensions(text)
@@ -1601,22 +1948,45 @@ def build_pdf_report(title: str, conductor_text: str, sheath_text: str) -> io.By
     )
 
     # Helper to draw a block with heading and multi-line text
+    def begin_body_text(y: float):
+        text_obj = c.beginText(left_margin, y)
+        text_obj.setFont("Helvetica", 9)
+        text_obj.setLeading(11)
+        return text_obj
+
+    def lines_fitting(top_y: float) -> int:
+        # Body lines (11pt leading) drawable from top_y down to bottom_margin
+        if top_y < bottom_margin:
+            return 0
+        return int((top_y - bottom_margin) // 11) + 1
+
     def draw_block(heading: str, block_text: str, start_y: float) -> float:
         c.setFont("Helvetica-Bold", 11)
         c.drawString(left_margin, start_y, heading)
-        c.setFont("Helvetica", 9)
         y = start_y - 12
 
         if not block_text:
             block_text = "No data."
 
-        for line in block_text.splitlines():
-            if y < bottom_margin:
+        # Split the lines into page-sized chunks up front: whatever fits
+        # below the heading, then full pages. Each chunk is one text object.
+        lines = block_text.splitlines()
+        first_count = lines_fitting(y)
+        page_count = lines_fitting(height - top_margin)
+        chunks = [lines[:first_count]] + [
+            lines[i:i + page_count]
+            for i in range(first_count, len(lines), page_count)
+        ]
+
+        for chunk_num, chunk in enumerate(chunks):
+            if chunk_num:
                 c.showPage()
-                c.setFont("Helvetica", 9)
                 y = height - top_margin
-            c.drawString(left_margin, y, line)
-            y -= 11
+            if chunk:
+                text_obj = begin_body_text(y)
+                text_obj.textLines(chunk, trim=0)
+                c.drawText(text_obj)
+                y -= 11 * len(chunk)
         return y - 10  # some extra spacing after block
 
     # Starting Y for body text
@@ -1649,6 +2019,12 @@ def index():
     return render_template("index_enhanced.html")
 
 
+@app.errorhandler(413)
+def upload_too_large(e):
+    limit_mb = app.config["MAX_CONTENT_LENGTH"] // (1024 * 1024)
+    return jsonify({"error": f"File too large (max {limit_mb} MB)"}), 413
+
+
 @app.route("/api/extract", methods=["POST"])
 def api_extract():
     if "file" not in request.files:
@@ -1659,15 +2035,15 @@ def api_extract():
         return jsonify({"error": "No selected file"}), 400
 
     try:
-        pdf_bytes = f.read()
-        
-        # Store the uploaded PDF in session for later merging
+        # Stream the upload to disk in chunks (never holding the whole PDF
+        # in memory) and store it in session for later merging
         temp_file = tempfile.NamedTemporaryFile(delete=False, suffix='.pdf')
-        temp_file.write(pdf_bytes)
+        f.save(temp_file)
         temp_file.close()
         session['uploaded_pdf_path'] = temp_file.name
         
-        text = ocr_pdf_to_text(pdf_bytes)
+        # OCR reads the same file from disk
+        text = ocr_pdf_to_text_cached(temp_file.name)
         data = extract_cable_parameters(text)
         return jsonify(data)
     except Exception as e:
@@ -1854,5 +2230,22 @@ def api_generate_pdf():
         return jsonify({"error": str(e)}), 500
 
 
+def main():
+    """
+    Start the enhanced UI server (port 5001, override with PORT / HOST).
+    Runs under waitress with a pool of request threads so uploads from
+    several users are processed side by side. Set FLASK_DEBUG=1 to get the
+    Werkzeug debug server with auto-reload instead.
+    """
+    host = os.environ.get("HOST", "127.0.0.1")
+    port = int(os.environ.get("PORT", 5001))
+
+    if os.environ.get("FLASK_DEBUG") == "1":
+        app.run(debug=True, host=host, port=port)
+        return
+
+    serve(app, host=host, port=port, threads=max(4, os.cpu_count() or 1))
+
+
 if __name__ == "__main__":
-    app.run(debug=True, port=5001)
+    main()